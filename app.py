@@ -1,14 +1,16 @@
+import os
+import math
 import requests
 import calendar
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from extensions import db 
+from extensions import db, hasher
 from datetime import datetime, date
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import extract
+from hashing import HashPoolBusy
 from datetime import datetime, timedelta
 from collections import defaultdict
+from sqlalchemy import select
 
 
 
@@ -20,12 +22,15 @@ app = Flask(__name__)
 # Basic Configuration - SECRET_KEY and Database URI for SQLAlchemy to use
 # Make sure to change 'your-very-secret-key' to a strong secret key in production
 app.config['SECRET_KEY'] = 'your-very-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///finance.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///finance.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize Database - SQLAlchemy
 db.init_app(app)
 
+# Initialize the password hashing pool (PASSWORD_HASH_METHOD / _WORKERS / _QUEUE_LIMIT)
+hasher.init_app(app)
+
 # Initialize Login Manager
 # Manages user sessions and authentication
 login_manager = LoginManager()
@@ -33,12 +38,31 @@ login_manager.init_app(app)
 login_manager.login_view = 'login' # Redirects here if login is required
 
 # Import models AFTER db is defined to avoid circular imports
-from models import User, Expense, Budget
+from models import User, Expense, Budget, RecurringExpense
+from queries import expense_totals, expense_rows, expense_series, statement_rows
+from recurring import CADENCES, MAX_BACKFILL_DAYS, materialize_due, start_scheduler
+from currency import (LEDGER_CURRENCY, snapshot_rates, ensure_snapshot, available_currencies,
+                      latest_rate, cached_conversion)
 
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
+# Too many logins/registrations are hashing at once - reject fast instead of queueing forever
+@app.errorhandler(HashPoolBusy)
+def hash_pool_busy(e):
+    db.session.rollback()
+    flash('The server is busy right now. Please try again in a moment.', 'danger')
+    template = 'register.html' if request.endpoint == 'register' else 'login.html'
+    return render_template(template), 429, {'Retry-After': '1'}
+
+# Formats an amount for the currency it is shown in: whole shillings for UGX,
+# cents for converted currencies (10,000 UGX is USD 2.70, not USD 3)
+@app.template_filter('money')
+def money(value, currency=LEDGER_CURRENCY):
+    decimals = 0 if currency == LEDGER_CURRENCY else 2
+    return f"{value:,.{decimals}f}"
+
 # --- AUTHENTICATION ROUTES ---
 
 # 1. Registration Route
@@ -65,7 +89,7 @@ def register():
                 email=email,
                 full_name=full_name,
                 username=username,
-                password_hash=generate_password_hash(password),
+                password_hash=hasher.hash(password),
                 dob=datetime.strptime(dob_str, '%Y-%m-%d').date() if dob_str else None,
                 # total_balance=0.0 #This initializes the user's balance at 0 upon registration
 
@@ -77,6 +101,8 @@ def register():
             db.session.commit()
             # flash('Account created! Please login.', 'success')
             return redirect(url_for('login', registered=True)) # Add a URL parameter instead
+        except HashPoolBusy:
+            raise
         except Exception as e:
             db.session.rollback()
             # This will show you exactly if any other field is missing
@@ -85,40 +111,62 @@ def register():
         
     return render_template('register.html')
 
+# Runs after a successful password check: upgrades the stored hash if PASSWORD_HASH_METHOD
+# changed since it was made, and reactivates a deactivated account
+def finish_login(account, password):
+    # Only an upgrade: if the pool is full, skip it and let the next login retry
+    new_hash = None
+    if hasher.needs_rehash(account.password_hash):
+        try:
+            new_hash = hasher.hash(password)
+        except HashPoolBusy:
+            pass
+
+    user = db.session.get(User, account.id)
+    if new_hash:
+        user.password_hash = new_hash
+
+    # --- NEW: Reactivation Logic ---
+    # Allows a user that deactivated their account to be able to to get it back
+    reactivated = hasattr(user, 'status') and user.status == "Deactivated"
+    if reactivated:
+        user.status = "Active"
+    # -------------------------------
+
+    if db.session.dirty:
+        try:
+            db.session.commit()
+            if reactivated:
+                flash("Welcome back! Your account has been reactivated.", "success")
+        except Exception:
+            db.session.rollback()
+    return user
+
 # 2. Login Route
 # Handles user login with email or phone number
 # Uses both GET and POST methods because it displays the login form and processes it
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    # Force the database to refresh its connection
-    db.session.remove()
-
     if request.method == 'POST':
         # 1. Get the specific fields from your modern toggle form
         email_val = request.form.get('email')
         password = request.form.get('password')
-        user = None
+        account = None
 
         # 2. Logic: Use email address to find user
         if email_val:
             identifier = email_val.strip().lower()
             # This is the "Dual Auth" magic: checks both columns for the input
-            user = User.query.filter((User.email == identifier) | (User.username == identifier)).first()
+            account = db.session.execute(
+                select(User.id, User.password_hash)
+                .where((User.email == identifier) | (User.username == identifier))
+            ).first()
+            # Hand the DB connection back before the slow hash so other requests can use it
+            db.session.commit()
 
         # 3. Security Check
-        if user and check_password_hash(user.password_hash, password):
-
-            # --- NEW: Reactivation Logic ---
-            # Allows a user that deactivated their account to be able to to get it back
-            if hasattr(user, 'status') and user.status == "Deactivated":
-                user.status = "Active"
-                try:
-                    db.session.commit()
-                    flash("Welcome back! Your account has been reactivated.", "success")
-                except Exception:
-                    db.session.rollback()
-            # -------------------------------
-
+        if account and account.password_hash and password and hasher.verify(account.password_hash, password):
+            user = finish_login(account, password)
             login_user(user)
             return redirect(url_for('dashboard'))
         
@@ -159,18 +207,32 @@ def dismiss_welcome():
 @app.route('/dashboard')
 @login_required 
 def dashboard():
-    all_expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date_to_handle.desc()).all()
+    # Read-only rows (plain tuples), the table never edits these directly
+    all_expenses = expense_rows(current_user.id)
     
     # This is your fixed budget that you set yourself
     budget_ceiling = current_user.total_balance
     
-    # Calculate what has actually been spent
-    total_spent = sum(exp.amount for exp in all_expenses if exp.category != 'Savings')
-    amount_saved = sum(exp.amount for exp in all_expenses if exp.category == 'Savings')
+    # Calculate what has actually been spent (summed in the database)
+    total_spent, amount_saved = expense_totals(current_user.id)
 
     # FIX: The "Remaining" is the Budget minus what is gone
     total_remaining = budget_ceiling - (total_spent + amount_saved)
 
+    # Optional: the same totals in the user's display currency (the cards stay in UGX)
+    currency = get_display_currency()
+    converted = None
+    if currency != LEDGER_CURRENCY:
+        spent_conv, saved_conv = cached_conversion('dashboard', current_user.id, currency,
+                                                   lambda: expense_totals(current_user.id, currency))
+        balance_conv = budget_ceiling * latest_rate(currency)
+        converted = {
+            'total_balance': balance_conv,
+            'total_spent': spent_conv,
+            'total_remaining': balance_conv - (spent_conv + saved_conv),
+            'total_saved': saved_conv,
+        }
+
     # --- NEW INITIALS LOGIC ---
     # This takes "Mubiru Stuart" and turns it into "MS"
     # It also works for "Ismah Lule" -> "IL" or "John" -> "J"
@@ -183,6 +245,8 @@ def dashboard():
                            total_spent=total_spent,
                            total_remaining=total_remaining,
                            total_saved=amount_saved,
+                           currency=currency,
+                           converted=converted, # None when viewing in UGX
                            initials=initials) # Send initials to the frontend
 
 # --- EXPENSE MANAGEMENT ROUTES ---
@@ -220,9 +284,7 @@ def add_expense():
 
         # --- NEW BUDGET GUARD START ---
         # 1. Calculate how much the user has already spent or saved
-        all_expenses = Expense.query.filter_by(user_id=current_user.id).all()
-        total_spent = sum(exp.amount for exp in all_expenses if exp.category != 'Savings')
-        amount_saved = sum(exp.amount for exp in all_expenses if exp.category == 'Savings')
+        total_spent, amount_saved = expense_totals(current_user.id)
         
         # 2. Determine the actual remaining balance
         total_remaining = current_user.total_balance - (total_spent + amount_saved)
@@ -323,23 +385,111 @@ def mark_paid(expense_id):
         db.session.rollback()
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Checks a recurring rule posted by the user. Returns (fields, None) or (None, error message)
+# The scheduler creates these expenses without the add_expense budget guard, so a bad rule
+# has to be stopped here
+def parse_recurring_rule(data):
+    missing = [field for field in ('title', 'category', 'amount') if data.get(field) in (None, '')]
+    if missing:
+        return None, f"Missing field(s): {', '.join(missing)}"
+
+    cadence = data.get('cadence', 'monthly')
+    if cadence not in CADENCES:
+        return None, f"Cadence must be one of: {', '.join(CADENCES)}"
+
+    try:
+        amount = float(data['amount'])
+        interval = int(data.get('interval', 1))
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else date.today()
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None
+    except (TypeError, ValueError):
+        return None, "Amount, interval and dates (YYYY-MM-DD) must be valid."
+
+    if not math.isfinite(amount) or amount <= 0:
+        return None, "Amount must be a number greater than zero."
+    if interval < 1:
+        return None, "Interval must be at least 1."
+    if end_date and end_date < start_date:
+        return None, "End date cannot be before the start date."
+    if start_date < date.today() - timedelta(days=MAX_BACKFILL_DAYS):
+        return None, f"Start date cannot be more than {MAX_BACKFILL_DAYS} days ago."
+
+    return {'title': data['title'], 'category': data['category'], 'amount': amount, 'cadence': cadence,
+            'interval': interval, 'start_date': start_date, 'end_date': end_date}, None
+
+# 6. Add Recurring Expense Route
+# Saves a rule (e.g. Rent every month) that the scheduler turns into real expenses when due
+@app.route('/add_recurring', methods=['POST'])
+@login_required
+def add_recurring():
+    data = request.get_json(silent=True) or {}
+
+    # 1. Validation
+    rule_fields, error = parse_recurring_rule(data)
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+
+    # 2. Save the rule
+    try:
+        rule = RecurringExpense(
+            **rule_fields,
+            next_due=rule_fields['start_date'], # The first occurrence is the start date itself
+            user_id=current_user.id
+        )
+        db.session.add(rule)
+        db.session.commit()
+        return jsonify({"status": "success", "id": rule.id})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# 7. Stop Recurring Expense Route
+# Deactivates a rule; expenses it already created are kept
+@app.route('/delete_recurring/<int:rule_id>', methods=['DELETE'])
+@login_required
+def delete_recurring(rule_id):
+    rule = RecurringExpense.query.get_or_404(rule_id)
+    if rule.user_id != current_user.id:
+        return jsonify({"status": "error", "message": "Unauthorized"}), 403
+
+    try:
+        rule.is_active = False
+        db.session.commit()
+        return jsonify({"status": "success"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # --- ADDITIONAL PAGES ROUTES ---
 
-def get_live_rates():
+# Real rates from the API, or None if it failed (used for the stored snapshots)
+def fetch_live_rates():
     try:
         # Using a free API (Example: ExchangeRate-API)
         # You can get a free key at https://www.exchangerate-api.com/
         API_KEY = "your_api_key_here" 
-        url = f"https://v6.exchangerate-api.com/v6/{API_KEY}/latest/UGX"
-        response = requests.get(url)
+        # RATES_API_URL lets tests and load runs point this at a local stub instead
+        url = os.environ.get('RATES_API_URL', f"https://v6.exchangerate-api.com/v6/{API_KEY}/latest/UGX")
+        response = requests.get(url, timeout=5)
         data = response.json()
         if data["result"] == "success":
             return data["conversion_rates"]
     except Exception as e:
         print(f"Rate fetch failed: {e}")
-    
+    return None
+
+def get_live_rates():
     # Fallback rates if the API fails or is offline
-    return {"USD": 0.00027, "EUR": 0.00025, "GBP": 0.00021, "KES": 0.039}
+    return fetch_live_rates() or {"USD": 0.00027, "EUR": 0.00025, "GBP": 0.00021, "KES": 0.039}
+
+# Picks the currency a page should be shown in: ?currency=USD, else the user's base currency
+# Anything we have no rates for falls back to the ledger currency (UGX)
+def get_display_currency():
+    currency = (request.args.get('currency') or current_user.base_currency or LEDGER_CURRENCY).upper()
+    if currency == LEDGER_CURRENCY:
+        return currency
+    ensure_snapshot(fetch_live_rates) # Daily snapshot, refreshed off the request path; fallback rates are never stored
+    return currency if currency in available_currencies() else LEDGER_CURRENCY
 
 @app.route('/accounts') # This matches your sidebar link
 @login_required
@@ -371,7 +521,8 @@ def budgets():
     }
 
     # 2. Fetch actual data from the logged-in user to ensure dashboard sync
-    expenses = current_user.expenses
+    # Sorted back into entry order so each category list reads the same as before
+    expenses = sorted(expense_rows(current_user.id), key=lambda exp: exp.id)
     total_balance = current_user.total_balance
     
     # 3. Process only categories that have expenses
@@ -426,8 +577,12 @@ def api_live_rates():
 @app.route('/analytics')
 @login_required
 def analytics():
-    # 1. Fetch user expenses
-    expenses = Expense.query.filter_by(user_id=current_user.id).order_by(Expense.date_to_handle.asc()).all()
+    # 1. Fetch user expenses - (amount, category, date_to_handle) tuples, already oldest first
+    # Amounts are converted to the display currency inside the query, and cached per ledger version
+    currency = get_display_currency()
+    expenses = cached_conversion('analytics', current_user.id, currency,
+                                 lambda: expense_series(current_user.id, currency))
+    starting_budget = current_user.total_balance * latest_rate(currency)
     
     # 2. UI Helpers for Navbar & Date Display
     name_parts = current_user.full_name.split()
@@ -446,7 +601,7 @@ def analytics():
     days_left = 0
     savings_ratio = 100
     spend_ratio = 0
-    effective_balance = current_user.total_balance
+    effective_balance = starting_budget
 
     # ADD THESE TWO LINES HERE (The Fix for your UnboundLocalError)
     days_remaining = 1 
@@ -462,8 +617,8 @@ def analytics():
         daily_data = defaultdict(float)
         cumulative_burn = 0
     
-        # We sort explicitly to ensure the line graph moves forward in time
-        sorted_expenses = sorted(expenses, key=lambda x: x.date_to_handle)
+        # The query already orders by date so the line graph moves forward in time
+        sorted_expenses = expenses
 
         for e in sorted_expenses:
             date_str = e.date_to_handle.strftime('%Y-%m-%d')
@@ -504,22 +659,24 @@ def analytics():
         # Matches Dashboard: Total Set - (Spent + Saved)
         total_spent_so_far = sum(abs(e.amount) for e in expenses if e.category != 'Savings')
         total_saved_so_far = sum(abs(e.amount) for e in expenses if e.category == 'Savings')
-        effective_balance = current_user.total_balance - (total_spent_so_far + total_saved_so_far)
+        effective_balance = starting_budget - (total_spent_so_far + total_saved_so_far)
 
         # 5. Calculate Real Runway
         # 625,000 / 491,667 = ~1.27 Days
         if avg_daily_burn > 0:
             days_left = round(effective_balance / avg_daily_burn) # Use 'effective_balance' because that's what you defined
-            projected_date = now + timedelta(days=days_left)
-            projected_date_str = projected_date.strftime('%d %b, %Y')
+            try:
+                projected_date = now + timedelta(days=days_left)
+                projected_date_str = projected_date.strftime('%d %b, %Y')
+            except OverflowError:
+                # A huge balance with a tiny burn rate runs past the year 9999
+                projected_date_str = "N/A"
         else:
             days_left = 0
             projected_date_str = "N/A"
 
         # 6. Savings Ratio Calculation
-        # Your "Budget" is the original total_balance you set
-        starting_budget = current_user.total_balance
-        
+        # Your "Budget" is the original total_balance you set (starting_budget, converted above)
         if starting_budget > 0:
             # Savings Ratio = (Remaining Cash + Savings) / Total Starting Budget
             # This shows what % of your original money isn't "burned" yet
@@ -561,8 +718,9 @@ def analytics():
                            days_remaining=days_remaining, # For daily limit display (Used to indicate how many days are left in the month)
                            daily_limit=daily_limit,
                            category_data=dict(category_data),
-                           total_budget=current_user.total_balance, # stays fixed at the set amount - 2.5M
+                           total_budget=starting_budget, # stays fixed at the set amount - 2.5M
                            total_remaining=effective_balance, # actual balance with some expenses added
+                           currency=currency,
                            show_empty=show_empty) # <--- ADD THIS LINE
 
 # PRINT RECEIPT ROUTE - Used in the accounts.html section
@@ -572,23 +730,21 @@ def analytics():
 def print_receipt():
     report_type = request.args.get('type')
     period = request.args.get('period') # e.g., "2026-01-22" or "2026-01"
+    currency = get_display_currency() # Amounts are converted in the same query
     
-    query = Expense.query.filter_by(user_id=current_user.id)
-
     if report_type == 'weekly':
         start_date = datetime.strptime(period, '%Y-%m-%d').date()
         end_date = start_date + timedelta(days=7)
-        expenses = query.filter(Expense.date_to_handle >= start_date, Expense.date_to_handle < end_date).all()
+        expenses = statement_rows(current_user.id, 'weekly', (start_date, end_date), currency)
         title = f"Weekly Statement ({start_date} to {end_date})"
     
     elif report_type == 'monthly':
         year, month = map(int, period.split('-'))
-        expenses = query.filter(extract('month', Expense.date_to_handle) == month, 
-                                extract('year', Expense.date_to_handle) == year).all()
+        expenses = statement_rows(current_user.id, 'monthly', (year, month), currency)
         title = f"Monthly Statement ({period})"
     
     else: # yearly
-        expenses = query.filter(extract('year', Expense.date_to_handle) == int(period)).all()
+        expenses = statement_rows(current_user.id, 'yearly', int(period), currency)
         title = f"Yearly Summary ({period})"
 
     total_spent = sum(exp.amount for exp in expenses)
@@ -597,7 +753,8 @@ def print_receipt():
                            expenses=expenses, 
                            title=title, 
                            total_spent=total_spent,
-                           total_balance=current_user.total_balance)
+                           currency=currency,
+                           total_balance=current_user.total_balance * latest_rate(currency))
 
 # USER PROFILE ROUTE
 # Displays the user's profile page with editable and non-editable fields
@@ -705,7 +862,7 @@ with app.app_context():
         admin = User(
             email="admin@financeflow.com",
             username="admin", 
-            password_hash=generate_password_hash("admin123"),
+            password_hash=hasher.hash_inline("admin123"), # Import time: keep the pool unstarted before any fork
             full_name="Admin User",
             dob=date(1990, 1, 1),
             total_balance=0.0 # Initializing balance at 0
@@ -714,5 +871,30 @@ with app.app_context():
         db.session.commit()
         print("Database initialized and Admin created!")
 
+# --- RECURRING EXPENSE SCHEDULER ---
+# Cron: `flask --app app materialize-recurring` (safe to rerun, nothing is duplicated)
+@app.cli.command('materialize-recurring')
+def materialize_recurring_command():
+    created = materialize_due()
+    print(f"{created} recurring expense(s) created")
+
+# Cron: `flask --app app snapshot-rates` stores today's conversion rates
+@app.cli.command('snapshot-rates')
+def snapshot_rates_command():
+    rates = fetch_live_rates()
+    if not rates:
+        raise SystemExit("Rate API did not answer, nothing saved")
+    saved = snapshot_rates(rates)
+    print(f"{saved} exchange rate(s) saved")
+
+# Optional in-process timer, e.g. RECURRING_SCHEDULER_INTERVAL=3600 for hourly
+# Started from the serving entry point below only, never on import, so CLI commands and
+# forked workers don't each run their own copy (WSGI hosts can call start_scheduler() once)
+app.config['RECURRING_SCHEDULER_INTERVAL'] = int(os.environ.get('RECURRING_SCHEDULER_INTERVAL', 0))
+
 if __name__ == '__main__':
+    # With debug=True the reloader runs the app in a child process (WERKZEUG_RUN_MAIN=true);
+    # only that child serves requests, so only it gets the timer
+    if app.config['RECURRING_SCHEDULER_INTERVAL'] > 0 and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler(app, app.config['RECURRING_SCHEDULER_INTERVAL'])
     app.run(debug=True)
\ No newline at end of file
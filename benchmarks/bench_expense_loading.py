@@ -0,0 +1,106 @@
+# Expense loading benchmark
+# Compares hydrating full Expense ORM objects against the column-projected
+# tuples in queries.py, for a single user with 100k expenses.
+#
+# Usage (from the project root):
+#   python benchmarks/bench_expense_loading.py [--expenses 100000] [--repeat 5]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+# Point the app at a throwaway SQLite file BEFORE importing it
+DB_DIR = tempfile.mkdtemp(prefix='fms-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db  # noqa: E402
+from models import User, Expense  # noqa: E402
+from queries import expense_totals, expense_rows, expense_series  # noqa: E402
+
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Rent', 'Savings', 'Health', 'Shopping']
+
+
+def seed(n_expenses):
+    user = User(full_name='Bench User', email='bench@financeflow.com', username='bench',
+                dob=date(1990, 1, 1), total_balance=1e12)
+    db.session.add(user)
+    db.session.commit()
+
+    start = datetime(2025, 1, 1)
+    rows = [{
+        'title': f'Expense {i}',
+        'amount': float(1000 + (i % 500) * 10),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'date_to_handle': start + timedelta(minutes=7 * i),
+        'is_covered': i % 3 == 0,
+        'user_id': user.id,
+    } for i in range(n_expenses)]
+    db.session.execute(Expense.__table__.insert(), rows)
+    db.session.commit()
+    return user.id
+
+
+# Old code paths (full ORM hydration) vs new ones (projected tuples)
+def orm_paths(user_id):
+    expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date_to_handle.desc()).all()
+    spent = sum(e.amount for e in expenses if e.category != 'Savings')
+    saved = sum(e.amount for e in expenses if e.category == 'Savings')
+    return expenses, spent, saved
+
+
+def tuple_paths(user_id):
+    expenses = expense_rows(user_id)
+    spent, saved = expense_totals(user_id)
+    return expenses, spent, saved
+
+
+def orm_series(user_id):
+    return Expense.query.filter_by(user_id=user_id).order_by(Expense.date_to_handle.asc()).all()
+
+
+def measure(label, fn, user_id, repeat):
+    # Latency: best of N with a fresh session each time (no identity map carry-over)
+    timings = []
+    for _ in range(repeat):
+        db.session.remove()
+        t0 = time.perf_counter()
+        fn(user_id)
+        timings.append(time.perf_counter() - t0)
+
+    # Memory: peak allocation while the result is alive
+    db.session.remove()
+    tracemalloc.start()
+    result = fn(user_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    print(f"{label:<38} best {min(timings) * 1000:8.1f} ms   "
+          f"median {sorted(timings)[len(timings) // 2] * 1000:8.1f} ms   "
+          f"peak {peak / 1024 / 1024:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expense loading benchmark')
+    parser.add_argument('--expenses', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id = seed(args.expenses)
+        print(f"{args.expenses:,} expenses for one user ({os.environ['DATABASE_URL']})\n")
+
+        measure('dashboard / guard - ORM objects', orm_paths, user_id, args.repeat)
+        measure('dashboard / guard - projected tuples', tuple_paths, user_id, args.repeat)
+        measure('guard only - SQL SUM', expense_totals, user_id, args.repeat)
+        measure('analytics - ORM objects', orm_series, user_id, args.repeat)
+        measure('analytics - projected tuples', expense_series, user_id, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Login throughput benchmark
+# Boots the app on a threaded WSGI server, fires a burst of concurrent logins and,
+# at the same time, measures dashboard latency for an already logged-in user.
+# Run it once with the hashing pool and once inline to compare:
+#   python benchmarks/bench_login.py                              # pool (default settings)
+#   PASSWORD_HASH_WORKERS=0 python benchmarks/bench_login.py      # inline, like before
+# Options: [--logins 400] [--concurrency 32]
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Point the app at a throwaway SQLite file BEFORE importing it
+DB_DIR = tempfile.mkdtemp(prefix='fms-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+from app import app  # noqa: E402
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput benchmark')
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # Logged-in user whose dashboard we keep loading during the burst
+    viewer = requests.Session()
+    viewer.post(f"{base}/login", data={'email': 'admin', 'password': 'admin123'})
+
+    stop = threading.Event()
+    dashboard_times = []
+
+    def watch_dashboard():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            viewer.get(f"{base}/dashboard")
+            dashboard_times.append(time.perf_counter() - t0)
+
+    def one_login(_):
+        t0 = time.perf_counter()
+        r = requests.post(f"{base}/login", data={'email': 'admin', 'password': 'admin123'},
+                          allow_redirects=False)
+        return r.status_code, time.perf_counter() - t0
+
+    # Baseline dashboard latency with no logins going on
+    watcher = threading.Thread(target=watch_dashboard)
+    watcher.start()
+    time.sleep(2)
+    stop.set()
+    watcher.join()
+    idle = dashboard_times[:]
+    dashboard_times.clear()
+
+    stop.clear()
+    watcher = threading.Thread(target=watch_dashboard)
+    watcher.start()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one_login, range(args.logins)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    watcher.join()
+    server.shutdown()
+
+    ok = [t for status, t in results if status == 302]
+    rejected = sum(1 for status, _ in results if status == 429)
+    other = len(results) - len(ok) - rejected
+
+    print(f"hash method {app.config['PASSWORD_HASH_METHOD']}, workers {app.config['PASSWORD_HASH_WORKERS']}, "
+          f"queue limit {app.config['PASSWORD_HASH_QUEUE_LIMIT']}")
+    print(f"{args.logins} logins, {args.concurrency} concurrent clients, {elapsed:.2f} s")
+    print(f"  successful logins/s : {len(ok) / elapsed:8.1f}")
+    print(f"  login p50 / p99     : {percentile(ok, 50) * 1000:8.1f} / {percentile(ok, 99) * 1000:.1f} ms")
+    print(f"  429 rejected        : {rejected:8d}   other errors: {other}")
+    print(f"dashboard idle   p50 / p99 : {statistics.median(idle) * 1000:8.1f} / {percentile(idle, 99) * 1000:.1f} ms")
+    if dashboard_times:
+        print(f"dashboard burst  p50 / p99 : {statistics.median(dashboard_times) * 1000:8.1f} / "
+              f"{percentile(dashboard_times, 99) * 1000:.1f} ms  ({len(dashboard_times)} requests)")
+
+
+if __name__ == '__main__':
+    main()
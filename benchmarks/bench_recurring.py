@@ -0,0 +1,75 @@
+# Recurring scheduler benchmark
+# Seeds N monthly rules spread across many users, then times materialize_due(),
+# a rerun (must create nothing) and a rerun after next_due is rewound (idempotency check).
+#
+# Usage (from the project root):
+#   python benchmarks/bench_recurring.py [--rules 100000] [--users 5000]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+# Point the app at a throwaway SQLite file BEFORE importing it
+DB_DIR = tempfile.mkdtemp(prefix='fms-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DB_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, update, func, select  # noqa: E402
+from app import app, db  # noqa: E402
+from models import User, Expense, RecurringExpense  # noqa: E402
+from recurring import materialize_due  # noqa: E402
+
+CATEGORIES = ['Rent', 'Bills', 'Insurance']
+
+
+def seed(n_rules, n_users, start):
+    db.session.execute(insert(User), [{
+        'full_name': f'User {i}', 'email': f'user{i}@financeflow.com', 'username': f'user{i}',
+        'dob': date(1990, 1, 1), 'total_balance': 1e9,
+    } for i in range(n_users)])
+    first_user = db.session.execute(select(func.min(User.id)).where(User.username == 'user0')).scalar()
+    db.session.execute(insert(RecurringExpense), [{
+        'title': f'Rule {i}', 'amount': 100.0 + i % 50, 'category': CATEGORIES[i % len(CATEGORIES)],
+        'cadence': 'monthly', 'interval': 1, 'start_date': start, 'next_due': start,
+        'is_active': True, 'user_id': first_user + i % n_users,
+    } for i in range(n_rules)])
+    db.session.commit()
+
+
+def timed(label, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    print(f"{label:<34} {time.perf_counter() - t0:7.2f} s   {result:,} expense(s) created")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recurring scheduler benchmark')
+    parser.add_argument('--rules', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    args = parser.parse_args()
+
+    today = date(2026, 10, 19)
+    start = date(2026, 10, 1)
+
+    with app.app_context():
+        seed(args.rules, args.users, start)
+        print(f"{args.rules:,} monthly rules across {args.users:,} users\n")
+
+        timed('first run', lambda: materialize_due(today))
+        timed('rerun', lambda: materialize_due(today))
+
+        # Rewind every rule as if a run crashed before saving next_due
+        db.session.execute(update(RecurringExpense).values(next_due=start))
+        db.session.commit()
+        timed('rerun after rewind', lambda: materialize_due(today))
+
+        total = db.session.execute(select(func.count(Expense.id))).scalar()
+        print(f"\nexpense rows in table: {total:,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+# Concurrent load test against a real WSGI server
+# Seeds a SQLite database, boots the app in a separate process on Werkzeug's threaded
+# (or forking) server, then runs virtual users that log in, open the dashboard, add
+# expenses, mark them paid, open analytics and print a monthly receipt in a weighted mix.
+# Each concurrency level reports throughput, p50/p99 latency and error rates, with
+# "database is locked" errors and 429s from the password hashing pool counted separately. Fully offline: get_live_rates() is
+# pointed at a local stub through RATES_API_URL.
+#
+# Usage (from the project root):
+#   python benchmarks/loadtest.py [--levels 1,4,16,32] [--duration 15] [--server threaded|processes]
+#                                 [--mix login=1,dashboard=5,add=3,paid=2,analytics=2,receipt=1]
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'load-test-password'
+DEFAULT_MIX = 'login=1,dashboard=5,add=3,paid=2,analytics=2,receipt=1'
+CATEGORIES = ['Food', 'Transport', 'Bills', 'Rent', 'Savings', 'Health', 'Shopping']
+STUB_RATES = {"UGX": 1, "USD": 0.00027, "EUR": 0.00025, "GBP": 0.00021, "KES": 0.039}
+
+
+# --- OFFLINE RATES STUB ---
+
+class RatesStub(BaseHTTPRequestHandler):
+    # Answers like exchangerate-api.com's /latest/UGX endpoint
+    def do_GET(self):
+        body = json.dumps({"result": "success", "base_code": "UGX", "conversion_rates": STUB_RATES}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# --- DATABASE SEEDING ---
+
+def seed(database_url, n_users, expenses_per_user):
+    """Creates load-test users with some history. Returns {username: [expense ids]}."""
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import insert, select
+    from app import app, db
+    from extensions import hasher
+    from models import User, Expense
+
+    with app.app_context():
+        password_hash = hasher.hash(PASSWORD) # One hash shared by every test user, seeding stays quick
+        db.session.execute(insert(User), [{
+            'full_name': f'Load User {i}', 'email': f'load{i}@financeflow.com', 'username': f'load{i}',
+            'dob': date(1990, 1, 1), 'password_hash': password_hash, 'total_balance': 50_000_000.0,
+            'base_currency': 'UGX',
+        } for i in range(n_users)])
+        users = dict(db.session.execute(select(User.username, User.id).where(User.username.like('load%'))).all())
+
+        start = datetime.now() - timedelta(days=90)
+        rows = []
+        for username, user_id in users.items():
+            for j in range(expenses_per_user):
+                rows.append({'title': f'Seeded {j}', 'amount': float(1000 + j * 10),
+                             'category': CATEGORIES[j % len(CATEGORIES)],
+                             'date_to_handle': start + timedelta(hours=j * 7),
+                             'is_covered': False, 'user_id': user_id})
+        if rows:
+            db.session.execute(Expense.__table__.insert(), rows)
+        db.session.commit()
+
+        ids = defaultdict(list)
+        for user_id, expense_id in db.session.execute(select(Expense.user_id, Expense.id)).all():
+            ids[user_id].append(expense_id)
+        return {username: ids[user_id] for username, user_id in users.items()}
+
+
+# --- SERVER PROCESS ---
+
+SERVER_CODE = """
+import logging, sys
+sys.path.insert(0, {root!r})
+from werkzeug.serving import run_simple
+from app import app
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+run_simple('127.0.0.1', {port}, app, threaded={threaded}, processes={processes}, use_reloader=False)
+"""
+
+
+class ServerLog:
+    # Keeps draining the server's stderr (a full pipe would freeze the server) and counts
+    # "database is locked" tracebacks from views that don't catch the error themselves
+    def __init__(self, stream):
+        self.lines = []
+        self.locked = 0
+        self._stream = stream
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self._stream:
+            self.lines.append(line)
+            if line.startswith('sqlalchemy.exc.OperationalError') and 'database is locked' in line:
+                self.locked += 1
+
+
+def start_server(port, env, mode, processes):
+    code = SERVER_CODE.format(root=ROOT, port=port, threaded=mode == 'threaded',
+                              processes=processes if mode == 'processes' else 1)
+    proc = subprocess.Popen([sys.executable, '-c', code], env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    log = ServerLog(proc.stderr)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/login", timeout=1)
+            return proc, log
+        except requests.ConnectionError:
+            if proc.poll() is not None:
+                time.sleep(0.5)
+                raise RuntimeError("Server exited:\n" + ''.join(log.lines))
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not start within 30 s")
+
+
+# --- VIRTUAL USERS ---
+
+class VirtualUser:
+    def __init__(self, base, username, expense_ids, mix, record):
+        self.base = base
+        self.username = username
+        self.expense_ids = list(expense_ids)
+        self.mix_names = list(mix)
+        self.mix_weights = [mix[name] for name in self.mix_names]
+        self.record = record
+        self.session = requests.Session()
+        self.logged_in = False
+
+    def request(self, op, method, path, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base + path, timeout=60, allow_redirects=False, **kwargs)
+        except requests.RequestException:
+            self.record(op, time.perf_counter() - t0, False, False, 0)
+            return None
+        elapsed = time.perf_counter() - t0
+
+        location = r.headers.get('Location', '')
+        if op == 'login':
+            ok = r.status_code == 302 and '/dashboard' in location # 200 means the form came back (refused)
+        else:
+            self.logged_in = not (r.status_code == 302 and '/login' in location)
+            ok = r.status_code < 400 and self.logged_in
+        locked = r.status_code >= 500 and 'database is locked' in r.text
+        self.record(op, elapsed, ok, locked, r.status_code)
+        return r
+
+    def login(self):
+        self.session.cookies.clear()
+        r = self.request('login', 'POST', '/login', data={'email': self.username, 'password': PASSWORD})
+        self.logged_in = r is not None and r.status_code == 302
+        if r is not None and r.status_code == 429:
+            time.sleep(float(r.headers.get('Retry-After', 1))) # Back off like the server asks
+
+    def dashboard(self):
+        self.request('dashboard', 'GET', '/dashboard')
+
+    def add(self):
+        self.request('add', 'POST', '/add_expense', json={
+            'title': 'Load test', 'category': random.choice(CATEGORIES), 'amount': random.randint(1, 50) * 1000})
+
+    def paid(self):
+        if self.expense_ids:
+            self.request('paid', 'POST', f"/mark_paid/{random.choice(self.expense_ids)}")
+
+    def analytics(self):
+        # Half the time in USD so the rate snapshot and conversion path are exercised too
+        self.request('analytics', 'GET', '/analytics' + ('?currency=USD' if random.random() < 0.5 else ''))
+
+    def receipt(self):
+        self.request('receipt', 'GET', f"/print_receipt?type=monthly&period={date.today():%Y-%m}")
+
+    def run(self, stop):
+        self.login()
+        while not stop.is_set():
+            # A refused login (e.g. 429 from the hashing pool) means trying again, like a real user
+            op = random.choices(self.mix_names, self.mix_weights)[0] if self.logged_in else 'login'
+            getattr(self, op)()
+
+
+def run_level(base, concurrency, duration, accounts, mix):
+    lock = threading.Lock()
+    samples = [] # (op, seconds, ok, locked, status)
+
+    def record(op, elapsed, ok, locked, status):
+        with lock:
+            samples.append((op, elapsed, ok, locked, status))
+
+    usernames = list(accounts)
+    stop = threading.Event()
+    workers = [VirtualUser(base, usernames[i % len(usernames)], accounts[usernames[i % len(usernames)]], mix, record)
+               for i in range(concurrency)]
+    threads = [threading.Thread(target=w.run, args=(stop,), daemon=True) for w in workers]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=60)
+    return samples, time.perf_counter() - t0
+
+
+# --- REPORTING ---
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float('nan')
+
+
+def report(concurrency, samples, elapsed, logged_locks):
+    times = [s[1] for s in samples]
+    errors = sum(1 for s in samples if not s[2])
+    locked = sum(1 for s in samples if s[3]) + logged_locks
+    rejected = sum(1 for s in samples if s[4] == 429)
+    print(f"{concurrency:>5} {len(samples) / elapsed:9.1f} {percentile(times, 50) * 1000:9.1f} "
+          f"{percentile(times, 99) * 1000:9.1f} {100 * errors / max(1, len(samples)):8.2f}% {locked:7d} {rejected:6d}")
+
+    by_op = defaultdict(list)
+    for op, t, ok, _, _ in samples:
+        by_op[op].append((t, ok))
+    for op in sorted(by_op):
+        op_times = [t for t, _ in by_op[op]]
+        op_errors = sum(1 for _, ok in by_op[op] if not ok)
+        print(f"        {op:<10} n={len(op_times):<6} p50 {percentile(op_times, 50) * 1000:8.1f} ms  "
+              f"p99 {percentile(op_times, 99) * 1000:8.1f} ms  errors {op_errors}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in ('login', 'dashboard', 'add', 'paid', 'analytics', 'receipt'):
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test against a real WSGI server')
+    parser.add_argument('--levels', default='1,4,16,32', help='Comma separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per concurrency level')
+    parser.add_argument('--users', type=int, default=50, help='Seeded accounts')
+    parser.add_argument('--expenses', type=int, default=200, help='Seeded expenses per account')
+    parser.add_argument('--server', choices=('threaded', 'processes'), default='threaded')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='Max concurrent forked workers for --server processes')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    levels = [int(x) for x in args.levels.split(',')]
+
+    # 1. Local rates stub, so nothing leaves the machine
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), RatesStub)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    rates_url = f"http://127.0.0.1:{stub.server_port}/latest/UGX"
+
+    # 2. Seeded SQLite database shared by the server process
+    db_path = os.path.join(tempfile.mkdtemp(prefix='fms-load-'), 'load.db')
+    database_url = f"sqlite:///{db_path}"
+    os.environ['RATES_API_URL'] = rates_url
+    accounts = seed(database_url, args.users, args.expenses)
+
+    # 3. The app under a real server, in its own process
+    env = dict(os.environ, DATABASE_URL=database_url, RATES_API_URL=rates_url)
+    port = free_port()
+    server, server_log = start_server(port, env, args.server, args.processes)
+    base = f"http://127.0.0.1:{port}"
+
+    print(f"{args.server} server, {args.users} users x {args.expenses} expenses, "
+          f"{args.duration:g} s per level, mix {args.mix}")
+    print(f"database {db_path}\n")
+    print(f"{'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>9} {'locked':>7} {'429s':>6}")
+    try:
+        for concurrency in levels:
+            locks_before = server_log.locked
+            samples, elapsed = run_level(base, concurrency, args.duration, accounts, mix)
+            report(concurrency, samples, elapsed, server_log.locked - locks_before)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
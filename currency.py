@@ -0,0 +1,215 @@
+# Server-side multi-currency support
+# Every expense and balance is stored in the ledger currency (UGX). To show a ledger in
+# another currency we:
+# 1. Snapshot the live API rates once a day into the exchange_rate table (real answers only).
+#    Pages never wait on the API once any snapshot exists: the day's refresh then runs in the
+#    background, and a failed fetch isn't retried for RETRY_AFTER_FAILURE seconds
+# 2. Convert a whole expense set inside ONE SQL query, joining each expense to the rate
+#    of its own day (or the closest earlier snapshot), never row by row in Python
+# 3. Cache the converted result per (view, user, currency), tagged with the ledger version,
+#    so repeated page loads skip the work until the user's expenses or the rates change.
+#    A new version replaces the old entry, and the cache is bounded by the rows it holds
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import select, func
+from sqlalchemy.dialects import sqlite, postgresql
+from extensions import db
+from models import Expense, ExchangeRate
+
+LEDGER_CURRENCY = 'UGX'
+CACHE_MAX_ROWS = 200_000 # Total cached rows across all entries (a ledger can be 100k rows on its own)
+RETRY_AFTER_FAILURE = 600 # Seconds to wait before calling the rates API again after it failed
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_rows = 0
+_snapshot_day = None # Last day we know a snapshot exists for (saves a query per request)
+_snapshot_lock = threading.Lock()
+_last_failed_fetch = None # time.monotonic() of the last failed API call
+_refreshing = False # A background refresh is already running
+
+
+# --- RATE SNAPSHOTS ---
+
+def snapshot_rates(rates, on=None):
+    """Stores (or refreshes) the rates for the given day. Returns how many currencies were saved."""
+    on = on or date.today()
+    rows = [{'rate_date': on, 'currency': code, 'rate': float(rate)}
+            for code, rate in rates.items() if code != LEDGER_CURRENCY]
+    if not rows:
+        return 0
+
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(ExchangeRate.__table__)
+    stmt = stmt.on_conflict_do_update(index_elements=['currency', 'rate_date'],
+                                      set_={'rate': stmt.excluded.rate})
+    try:
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def ensure_snapshot(fetch_rates):
+    """Makes sure today's snapshot gets taken with `fetch_rates()`.
+
+    `fetch_rates` returns None when the API didn't answer; nothing is stored then, and the
+    API is left alone for RETRY_AFTER_FAILURE seconds. Only the very first snapshot is taken
+    inline - after that the page renders with the latest stored rates while today's are
+    fetched on a background thread.
+    """
+    global _snapshot_day, _refreshing
+    today = date.today()
+    with _snapshot_lock:
+        if _snapshot_day == today or _refreshing:
+            return
+        if _last_failed_fetch is not None and time.monotonic() - _last_failed_fetch < RETRY_AFTER_FAILURE:
+            return
+
+    latest = db.session.execute(select(func.max(ExchangeRate.rate_date))).scalar()
+    if latest == today:
+        _snapshot_day = today
+        return
+    if latest is None:
+        _take_snapshot(fetch_rates, today)
+        return
+
+    with _snapshot_lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    app = current_app._get_current_object()
+    threading.Thread(target=_refresh_in_background, args=(app, fetch_rates, today),
+                     name='rates-snapshot', daemon=True).start()
+
+
+def _take_snapshot(fetch_rates, today):
+    global _snapshot_day, _last_failed_fetch
+    rates = fetch_rates()
+    if not rates:
+        _last_failed_fetch = time.monotonic()
+        return
+    snapshot_rates(rates, today)
+    _snapshot_day = today
+    _last_failed_fetch = None
+
+
+def _refresh_in_background(app, fetch_rates, today):
+    global _refreshing, _last_failed_fetch
+    try:
+        with app.app_context():
+            _take_snapshot(fetch_rates, today)
+    except Exception:
+        _last_failed_fetch = time.monotonic()
+        app.logger.exception('Rate snapshot failed')
+    finally:
+        _refreshing = False
+
+
+def available_currencies():
+    """Currencies we can convert to (the ledger currency plus everything ever snapshotted)."""
+    codes = db.session.execute(select(ExchangeRate.currency).distinct()).scalars().all()
+    return [LEDGER_CURRENCY] + sorted(codes)
+
+
+def latest_rate(currency):
+    """The most recent rate for a currency (1.0 for the ledger currency)."""
+    if currency == LEDGER_CURRENCY:
+        return 1.0
+    rate = db.session.execute(
+        select(ExchangeRate.rate)
+        .where(ExchangeRate.currency == currency)
+        .order_by(ExchangeRate.rate_date.desc())
+        .limit(1)
+    ).scalar()
+    return rate if rate is not None else 1.0
+
+
+# --- SQL CONVERSION ---
+
+def converted_amount(currency):
+    """Column expression: Expense.amount converted at the rate of the expense's day.
+
+    Uses the closest snapshot on or before that day, falling back to the earliest
+    snapshot for expenses older than the rate table. Labelled 'amount' so templates
+    keep reading exp.amount.
+    """
+    if currency == LEDGER_CURRENCY:
+        return Expense.amount
+
+    on_or_before = (select(ExchangeRate.rate)
+                    .where(ExchangeRate.currency == currency,
+                           ExchangeRate.rate_date <= func.date(Expense.date_to_handle))
+                    .order_by(ExchangeRate.rate_date.desc())
+                    .limit(1)
+                    .scalar_subquery())
+    earliest = (select(ExchangeRate.rate)
+                .where(ExchangeRate.currency == currency)
+                .order_by(ExchangeRate.rate_date.asc())
+                .limit(1)
+                .scalar_subquery())
+    return (Expense.amount * func.coalesce(on_or_before, earliest, 1.0)).label('amount')
+
+
+# --- CONVERSION CACHE ---
+
+def ledger_version(user_id, currency):
+    """Cheap fingerprint that changes whenever the user's expenses or the currency's rates change.
+
+    The rate part covers same-day refreshes too (e.g. `flask snapshot-rates` from cron in
+    another process), so the cache never mixes old and new rates.
+    """
+    count, max_id, total = db.session.execute(
+        select(func.count(Expense.id), func.max(Expense.id), func.coalesce(func.sum(Expense.amount), 0.0))
+        .where(Expense.user_id == user_id)
+    ).one()
+    rates = None
+    if currency != LEDGER_CURRENCY:
+        rates = tuple(db.session.execute(
+            select(func.count(ExchangeRate.id), func.max(ExchangeRate.rate_date), func.sum(ExchangeRate.rate))
+            .where(ExchangeRate.currency == currency)
+        ).one())
+    return (count, max_id, total, rates)
+
+
+def _row_count(result):
+    return len(result) if isinstance(result, list) else 1
+
+
+def cached_conversion(view, user_id, currency, compute):
+    """Returns compute() from the cache if it was computed for the current ledger version.
+
+    One entry per (view, user, currency): recomputing after a change replaces the stale
+    result. Least recently used entries are dropped once CACHE_MAX_ROWS rows are cached.
+    """
+    global _cache_rows
+    key = (view, user_id, currency)
+    version = ledger_version(user_id, currency)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    result = compute()
+    rows = _row_count(result)
+
+    with _cache_lock:
+        stale = _cache.pop(key, None)
+        if stale is not None:
+            _cache_rows -= stale[2]
+        if rows > CACHE_MAX_ROWS: # Too big to keep without pushing everyone else out
+            return result
+        _cache[key] = (version, result, rows)
+        _cache_rows += rows
+        while _cache_rows > CACHE_MAX_ROWS:
+            _, (_, _, evicted_rows) = _cache.popitem(last=False)
+            _cache_rows -= evicted_rows
+    return result
@@ -1,2 +1,4 @@
 from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
\ No newline at end of file
+from hashing import PasswordHasher
+db = SQLAlchemy()
+hasher = PasswordHasher()
@@ -0,0 +1,99 @@
+# Password hashing worker pool
+# Hashing is deliberately slow (scrypt/pbkdf2), so a login burst run inline on the request
+# threads can starve every other page. Instead, hashes run on a small dedicated pool:
+# - At most PASSWORD_HASH_WORKERS hashes run at once, PASSWORD_HASH_QUEUE_LIMIT more may wait
+#   (0 workers = hash inline on the request thread, the old behaviour)
+# - Anything beyond that is rejected straight away (HashPoolBusy -> HTTP 429)
+# - PASSWORD_HASH_METHOD controls the hash parameters; old hashes are upgraded on login
+# Werkzeug's hashlib calls release the GIL, so the pool threads really run in parallel.
+# The pool is built lazily in each process: threads don't survive fork(), so a pool made
+# before a pre-fork server (run_simple processes=N, gunicorn --preload) forks would hang.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue is full; the request should be retried later."""
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self._prefix = None
+        self._workers = 0
+        self._queue_limit = 0
+        self._executor = None
+        self._slots = None
+        self._pool_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_pool)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Defaults come from the environment so deployments can tune them without code changes
+        app.config.setdefault('PASSWORD_HASH_METHOD', os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'))
+        app.config.setdefault('PASSWORD_HASH_WORKERS',
+                              int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))))
+        # Default queue: 4 waiting hashes per worker, so a queued login waits for at most a few hashes
+        app.config.setdefault('PASSWORD_HASH_QUEUE_LIMIT',
+                              int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 4 * app.config['PASSWORD_HASH_WORKERS'])))
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        # Werkzeug fills in default parameters (e.g. scrypt -> scrypt:32768:8:1), so take the
+        # full prefix from a real hash to compare against stored ones
+        self._prefix = generate_password_hash('', method=self.method).split('$', 1)[0]
+
+        self._workers = app.config['PASSWORD_HASH_WORKERS']
+        self._queue_limit = app.config['PASSWORD_HASH_QUEUE_LIMIT']
+        self._reset_pool()
+        app.extensions['password_hasher'] = self
+
+    def _reset_pool(self):
+        # Also runs in every forked child: forget the parent's (dead) worker threads
+        self._executor = None
+        self._slots = None
+        self._pool_lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._pool_lock:
+                if self._executor is None:
+                    self._slots = threading.BoundedSemaphore(self._workers + self._queue_limit)
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='password-hash')
+        return self._executor, self._slots
+
+    def _run(self, fn, *args):
+        # No pool configured (PASSWORD_HASH_WORKERS=0): hash inline like before
+        if self._workers <= 0:
+            return fn(*args)
+
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            raise HashPoolBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Hashes a password with the configured method, on the pool."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def hash_inline(self, password):
+        """Hashes on the calling thread - for startup seeding and scripts, not requests."""
+        return generate_password_hash(password, self.method)
+
+    def verify(self, password_hash, password):
+        """Checks a password against a stored hash, on the pool."""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with different parameters than the configured ones."""
+        return password_hash.split('$', 1)[0] != self._prefix
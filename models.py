@@ -24,6 +24,7 @@ class User(UserMixin, db.Model):
     # Relationships
     expenses = db.relationship('Expense', backref='owner', lazy=True)
     budgets = db.relationship('Budget', backref='owner', lazy=True)
+    recurring_expenses = db.relationship('RecurringExpense', backref='owner', lazy=True)
 
 # Expense model to store individual expenses
 class Expense(db.Model): 
@@ -41,4 +42,36 @@ class Budget(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     category = db.Column(db.String(50), nullable=False)
     amount_allocated = db.Column(db.Float, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
\ No newline at end of file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+# Recurring expense rule (Rent, Bills, Insurance...) that the scheduler turns into real expenses
+# cadence is one of 'daily', 'weekly', 'monthly', 'yearly' and repeats every `interval` of those
+class RecurringExpense(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    cadence = db.Column(db.String(10), nullable=False, default='monthly')
+    interval = db.Column(db.Integer, nullable=False, default=1)
+    start_date = db.Column(db.Date, nullable=False) # Also the anchor day for monthly/yearly rules
+    end_date = db.Column(db.Date, nullable=True) # None means it repeats forever
+    next_due = db.Column(db.Date, nullable=False, index=True) # Next occurrence that has NOT been materialized yet
+    is_active = db.Column(db.Boolean, default=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+# One row per (rule, occurrence date) that has been materialized
+# The primary key is what makes scheduler reruns idempotent
+class RecurringOccurrence(db.Model):
+    rule_id = db.Column(db.Integer, db.ForeignKey('recurring_expense.id'), primary_key=True)
+    occurrence_date = db.Column(db.Date, primary_key=True)
+    run_id = db.Column(db.String(32), nullable=False, index=True) # Scheduler run that claimed this occurrence
+
+# Dated snapshot of conversion rates (1 UGX = `rate` units of `currency`)
+# Filled from fetch_live_rates() (real API answers only) so ledgers can be converted server-side without hitting the API
+class ExchangeRate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rate_date = db.Column(db.Date, nullable=False)
+    currency = db.Column(db.String(3), nullable=False)
+    rate = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('currency', 'rate_date', name='uq_exchange_rate_currency_date'),)
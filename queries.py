@@ -0,0 +1,68 @@
+# Read-only data access layer for expenses
+# The dashboard, analytics, accounts and receipt pages only READ expenses, so
+# there is no need to build full Expense ORM objects (identity map tracking,
+# attribute instrumentation) just to look at amount, category and date.
+# Every helper here selects only the columns it needs and returns plain
+# SQLAlchemy Row tuples (they still support exp.amount style access in Jinja).
+# Helpers that take a `currency` convert amounts inside the same query (see currency.py).
+
+from sqlalchemy import select, func, case, extract
+from extensions import db
+from models import Expense
+from currency import LEDGER_CURRENCY, converted_amount
+
+
+# 1. Column sets
+# Display rows need enough to render the tables; series rows are for the math only
+def display_columns(currency=LEDGER_CURRENCY):
+    return (Expense.id, Expense.title, converted_amount(currency), Expense.category,
+            Expense.date_to_handle, Expense.is_covered)
+
+
+def series_columns(currency=LEDGER_CURRENCY):
+    return (converted_amount(currency), Expense.category, Expense.date_to_handle)
+
+
+def expense_totals(user_id, currency=LEDGER_CURRENCY):
+    """Returns (total_spent, amount_saved) for a user, summed inside the database."""
+    is_savings = Expense.category == 'Savings'
+    amount = converted_amount(currency)
+    stmt = select(
+        func.coalesce(func.sum(case((is_savings, 0.0), else_=amount)), 0.0),
+        func.coalesce(func.sum(case((is_savings, amount), else_=0.0)), 0.0),
+    ).where(Expense.user_id == user_id)
+    total_spent, amount_saved = db.session.execute(stmt).one()
+    return total_spent, amount_saved
+
+
+def expense_rows(user_id):
+    """Returns lightweight display rows (id, title, amount, category, date_to_handle, is_covered), newest first."""
+    stmt = (select(*display_columns())
+            .where(Expense.user_id == user_id)
+            .order_by(Expense.date_to_handle.desc()))
+    return db.session.execute(stmt).all()
+
+
+def expense_series(user_id, currency=LEDGER_CURRENCY):
+    """Returns (amount, category, date_to_handle) tuples oldest first, for the analytics graphs."""
+    stmt = (select(*series_columns(currency))
+            .where(Expense.user_id == user_id)
+            .order_by(Expense.date_to_handle.asc()))
+    return db.session.execute(stmt).all()
+
+
+def statement_rows(user_id, report_type, period, currency=LEDGER_CURRENCY):
+    """Returns display rows for a weekly, monthly or yearly statement."""
+    stmt = select(*display_columns(currency)).where(Expense.user_id == user_id)
+
+    if report_type == 'weekly':
+        start_date, end_date = period
+        stmt = stmt.where(Expense.date_to_handle >= start_date, Expense.date_to_handle < end_date)
+    elif report_type == 'monthly':
+        year, month = period
+        stmt = stmt.where(extract('month', Expense.date_to_handle) == month,
+                          extract('year', Expense.date_to_handle) == year)
+    else: # yearly
+        stmt = stmt.where(extract('year', Expense.date_to_handle) == period)
+
+    return db.session.execute(stmt).all()
@@ -0,0 +1,142 @@
+# Recurring expense scheduler
+# Turns due RecurringExpense rules into normal Expense rows for ALL users at once.
+# - Works in batches of rules (keyset paging by id), never loops per user through the ORM
+# - Every occurrence is first claimed in recurring_occurrence (rule_id, occurrence_date);
+#   claims that already exist are skipped, so reruns never create duplicates
+# Run it from cron with `flask --app app materialize-recurring`, or set
+# RECURRING_SCHEDULER_INTERVAL (seconds) to run it on a background thread.
+
+import calendar
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.dialects import sqlite, postgresql
+from extensions import db
+from models import Expense, RecurringExpense, RecurringOccurrence
+
+CADENCES = ('daily', 'weekly', 'monthly', 'yearly')
+MAX_BACKFILL_DAYS = 366 # How far in the past a new rule may start (its missed occurrences are all created)
+
+# Core (not ORM) statements: executemany straight to the driver, no per-row ORM bookkeeping
+_rules = RecurringExpense.__table__
+ADVANCE_RULE = (update(_rules)
+                .where(_rules.c.id == bindparam('rule_id'))
+                .values(next_due=bindparam('new_next_due'), is_active=bindparam('still_active')))
+
+
+def add_months(day, months, anchor_day):
+    """Moves `day` forward by whole months, keeping the anchor day (clamped to short months)."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(current, cadence, interval, anchor_day):
+    """Returns the occurrence that follows `current` for the given cadence rule."""
+    if cadence == 'daily':
+        return current + timedelta(days=interval)
+    if cadence == 'weekly':
+        return current + timedelta(weeks=interval)
+    if cadence == 'monthly':
+        return add_months(current, interval, anchor_day)
+    if cadence == 'yearly':
+        return add_months(current, 12 * interval, anchor_day)
+    raise ValueError(f"Unknown cadence: {cadence}")
+
+
+def _insert_ignore(table):
+    # INSERT that silently skips rows whose primary key already exists
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return sqlite.insert(table).on_conflict_do_nothing()
+
+
+def materialize_due(today=None, batch_size=5000):
+    """Creates the Expense rows for every occurrence due on or before `today`. Returns how many were created."""
+    today = today or date.today()
+    run_id = uuid.uuid4().hex
+    created = 0
+    last_id = 0
+
+    while True:
+        # 1. Next batch of due rules, as plain tuples
+        rules = db.session.execute(
+            select(RecurringExpense.id, RecurringExpense.title, RecurringExpense.amount,
+                   RecurringExpense.category, RecurringExpense.cadence, RecurringExpense.interval,
+                   RecurringExpense.start_date, RecurringExpense.end_date,
+                   RecurringExpense.next_due, RecurringExpense.user_id)
+            .where(RecurringExpense.is_active.is_(True),
+                   RecurringExpense.next_due <= today,
+                   RecurringExpense.id > last_id)
+            .order_by(RecurringExpense.id)
+            .limit(batch_size)
+        ).all()
+        if not rules:
+            break
+        last_id = rules[-1].id
+
+        # 2. Work out every missed occurrence per rule (catch-up) and where each rule goes next
+        claims = []
+        advances = []
+        by_id = {}
+        for rule in rules:
+            by_id[rule.id] = rule
+            occurrence = rule.next_due
+            while occurrence <= today and (rule.end_date is None or occurrence <= rule.end_date):
+                claims.append({'rule_id': rule.id, 'occurrence_date': occurrence, 'run_id': run_id})
+                occurrence = next_occurrence(occurrence, rule.cadence, rule.interval, rule.start_date.day)
+            ended = rule.end_date is not None and occurrence > rule.end_date
+            advances.append({'rule_id': rule.id, 'new_next_due': occurrence, 'still_active': not ended})
+
+        try:
+            # 3. Claim the occurrences; ones claimed by an earlier run are ignored
+            if claims:
+                db.session.execute(_insert_ignore(RecurringOccurrence.__table__), claims)
+
+            # 4. Only the claims this run won become expenses
+            won = db.session.execute(
+                select(RecurringOccurrence.rule_id, RecurringOccurrence.occurrence_date)
+                .where(RecurringOccurrence.run_id == run_id,
+                       RecurringOccurrence.rule_id.between(rules[0].id, last_id))
+            ).all()
+            if won:
+                db.session.execute(Expense.__table__.insert(), [{
+                    'title': by_id[rule_id].title,
+                    'amount': by_id[rule_id].amount,
+                    'category': by_id[rule_id].category,
+                    'date_to_handle': datetime.combine(occurrence_date, datetime.min.time()),
+                    'is_covered': False, # Shows as "Pending" until the user marks it paid
+                    'user_id': by_id[rule_id].user_id,
+                } for rule_id, occurrence_date in won])
+
+            # 5. Move every rule in the batch to its next due date
+            db.session.execute(ADVANCE_RULE, advances)
+            db.session.commit()
+            created += len(won)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return created
+
+
+def start_scheduler(app, interval_seconds):
+    """Runs materialize_due() every `interval_seconds` on a daemon thread. Returns the stop event."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    created = materialize_due()
+                    db.session.remove()
+                if created:
+                    print(f"Recurring scheduler: {created} expense(s) created")
+            except Exception as e:
+                print(f"Recurring scheduler failed: {e}")
+            stop.wait(interval_seconds)
+
+    threading.Thread(target=loop, name='recurring-scheduler', daemon=True).start()
+    return stop